@@ -0,0 +1,304 @@
+"""Offline compilation of rig configuration files into ready-to-send payloads.
+
+A configuration is a JSON file with per-channel parameters (missing ones fall back
+to CHANNEL_PARAM_DEFAULTS), trigger modes and optional custom trains::
+
+    {
+        "channels": [{"phase1Voltage": 5, "phase1Duration": 0.002}, {}, {}, {}],
+        "triggers": [{"triggerMode": "toggle"}, {}],
+        "custom_trains": [
+            {"pulse_times": [0, 0.01, 0.02], "pulse_voltages": [1, 2, 3]},
+            {"pulse_width": 0.001, "pulse_voltages": [0, 1, 2, 1, 0]},
+        ],
+    }
+
+List positions are 0-indexed channels / custom train slots. Each configuration is
+compiled per model (1: firmware < 20, 2: firmware >= 20) into the custom train and
+PROGRAM_ALL payloads and cached on disk, keyed by the sha256 of the canonical
+configuration, the model, the compile settings and the encoder version.
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from pypulsepal.definitions import (
+    CHANNEL_PARAM_DEFAULTS,
+    DAC_BITMAX_MODELS,
+    PARAM_DTYPE_MODELS,
+    PULSEPAL_CYCLE_FREQUENCY,
+    TRIGGER_MODE_NAMES,
+    TRIGGER_PARAM_DEFAULTS,
+)
+from pypulsepal.payloads import encode_custom_train_payload, encode_program_all_payload
+from pypulsepal.utils import volts_to_dac_codes
+
+PAYLOAD_MAGIC = b"PPCP"
+PAYLOAD_FORMAT_VERSION = 1
+# Bump whenever the compiled bytes change, so stale cache entries are not reused
+# 2: custom train times rounded to device cycles instead of truncated
+ENCODER_VERSION = 2
+MODELS = (1, 2)
+_PREFIX = struct.Struct("<4sBI")
+
+
+class CompiledPayload:
+    """Model-specific wire payloads of one configuration, plus the client state"""
+
+    def __init__(self, metadata=None, segments=None):
+        """
+
+        :param metadata: dict with "model", "config_hash", channel counts,
+            "cycle_frequency", "params" and "segments" (kind and slot per segment)
+        :param segments: list of payload bytes, sent in order
+        """
+        self.metadata = metadata
+        self.segments = segments
+
+    @property
+    def model(self):
+        return self.metadata["model"]
+
+    def custom_trains(self):
+        """{slot: (pulse_times, pulse_voltages)} as views into the payloads"""
+        voltage_dtype = np.dtype(PARAM_DTYPE_MODELS[self.model]["phase1Voltage"])
+        offset = 2 + 4 if self.model == 1 else 1 + 4
+        custom_trains = {}
+        for info, segment in zip(self.metadata["segments"], self.segments):
+            if info["kind"] != "custom_train":
+                continue
+            n_pulses = np.frombuffer(segment, "uint32", count=1, offset=offset - 4)[0]
+            custom_trains[info["slot"]] = (
+                np.frombuffer(segment, "uint32", count=n_pulses, offset=offset),
+                np.frombuffer(
+                    segment, voltage_dtype, count=n_pulses, offset=offset + 4 * n_pulses
+                ),
+            )
+        return custom_trains
+
+    def to_bytes(self):
+        metadata = json.dumps(self.metadata, sort_keys=True).encode()
+        parts = [_PREFIX.pack(PAYLOAD_MAGIC, PAYLOAD_FORMAT_VERSION, len(metadata))]
+        parts.append(metadata)
+        for segment in self.segments:
+            parts += [struct.pack("<I", len(segment)), segment]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data=None):
+        magic, version, metadata_nbytes = _PREFIX.unpack_from(data)
+        if magic != PAYLOAD_MAGIC or version != PAYLOAD_FORMAT_VERSION:
+            raise ValueError(
+                f"Not a version {PAYLOAD_FORMAT_VERSION} compiled PulsePal payload"
+            )
+        offset = _PREFIX.size
+        metadata = json.loads(data[offset : offset + metadata_nbytes])
+        offset += metadata_nbytes
+        segments = []
+        for _ in metadata["segments"]:
+            (nbytes,) = struct.unpack_from("<I", data, offset)
+            segments.append(bytes(data[offset + 4 : offset + 4 + nbytes]))
+            offset += 4 + nbytes
+        return cls(metadata=metadata, segments=segments)
+
+    @classmethod
+    def load(cls, path=None):
+        return cls.from_bytes(Path(path).read_bytes())
+
+
+def load_config(path=None):
+    with Path(path).open() as f:
+        return json.load(f)
+
+
+def config_hash(
+    config=None,
+    model=None,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+    nr_output_channels=4,
+    nr_trigger_channels=2,
+):
+    """Cache key: sha256 of the canonical configuration and compile settings"""
+    canonical = json.dumps(
+        {
+            "config": config,
+            "model": model,
+            "cycle_frequency": cycle_frequency,
+            "nr_output_channels": nr_output_channels,
+            "nr_trigger_channels": nr_trigger_channels,
+            "format_version": PAYLOAD_FORMAT_VERSION,
+            "encoder_version": ENCODER_VERSION,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def resolve_config_params(config=None, nr_output_channels=4, nr_trigger_channels=2):
+    """Per-channel parameter lists from a configuration, with defaults filled in"""
+    channels = config.get("channels", [])
+    triggers = config.get("triggers", [])
+    params = {
+        param: [
+            channels[channel].get(param, default)
+            if channel < len(channels)
+            else default
+            for channel in range(nr_output_channels)
+        ]
+        for param, default in CHANNEL_PARAM_DEFAULTS.items()
+    }
+    for param, default in TRIGGER_PARAM_DEFAULTS.items():
+        params[param] = [
+            triggers[channel].get(param, default)
+            if channel < len(triggers)
+            else default
+            for channel in range(nr_trigger_channels)
+        ]
+    params["triggerMode"] = [
+        TRIGGER_MODE_NAMES[mode] if isinstance(mode, str) else mode
+        for mode in params["triggerMode"]
+    ]
+    return params
+
+
+def compile_config(
+    config=None,
+    model=None,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+    nr_output_channels=4,
+    nr_trigger_channels=2,
+):
+    """Compile one configuration for one model.
+
+    :param config: configuration dict (see module docstring)
+    :param model: PulsePal model (1 or 2)
+    :return: CompiledPayload with custom train payloads first, then PROGRAM_ALL
+    """
+    params = resolve_config_params(
+        config=config,
+        nr_output_channels=nr_output_channels,
+        nr_trigger_channels=nr_trigger_channels,
+    )
+
+    segments = []
+    segment_info = []
+    for slot, train in enumerate(config.get("custom_trains", [])):
+        if not train:
+            continue
+        pulse_voltages = np.asarray(train["pulse_voltages"], dtype="float64")
+        if "pulse_times" in train:
+            pulse_times = np.asarray(train["pulse_times"], dtype="float64")
+        else:
+            pulse_times = np.arange(pulse_voltages.size) * train["pulse_width"]
+        segments.append(
+            encode_custom_train_payload(
+                pulse_train_id=slot,
+                pulse_times=np.round(pulse_times * cycle_frequency).astype("uint32"),
+                pulse_voltages=volts_to_dac_codes(
+                    volts=pulse_voltages,
+                    dac_bitMax=DAC_BITMAX_MODELS[model],
+                    dtype=PARAM_DTYPE_MODELS[model]["phase1Voltage"],
+                ),
+                model=model,
+            )
+        )
+        segment_info.append({"kind": "custom_train", "slot": slot})
+
+    segments.append(
+        encode_program_all_payload(
+            params=params,
+            model=model,
+            cycle_frequency=cycle_frequency,
+            nr_output_channels=nr_output_channels,
+            nr_trigger_channels=nr_trigger_channels,
+        )
+    )
+    segment_info.append({"kind": "program_all", "slot": None})
+
+    metadata = {
+        "model": model,
+        "config_hash": config_hash(
+            config=config,
+            model=model,
+            cycle_frequency=cycle_frequency,
+            nr_output_channels=nr_output_channels,
+            nr_trigger_channels=nr_trigger_channels,
+        ),
+        "cycle_frequency": cycle_frequency,
+        "nr_output_channels": nr_output_channels,
+        "nr_trigger_channels": nr_trigger_channels,
+        "params": params,
+        "segments": segment_info,
+    }
+    return CompiledPayload(metadata=metadata, segments=segments)
+
+
+def compile_config_file(
+    path=None,
+    cache_dir=None,
+    models=MODELS,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+    nr_output_channels=4,
+    nr_trigger_channels=2,
+):
+    """Compile a configuration file for each model into `cache_dir`, if not cached.
+
+    :return: {model: path of the compiled payload file}
+    """
+    config = load_config(path=path)
+    cache_dir = Path(cache_dir)
+    compiled_paths = {}
+    for model in models:
+        settings = {
+            "model": model,
+            "cycle_frequency": cycle_frequency,
+            "nr_output_channels": nr_output_channels,
+            "nr_trigger_channels": nr_trigger_channels,
+        }
+        compiled_path = cache_dir / f"{config_hash(config=config, **settings)}.ppc"
+        if not compiled_path.exists():
+            compiled = compile_config(config=config, **settings)
+            # Write atomically: workers may compile identical configs concurrently
+            tmp_path = compiled_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(compiled.to_bytes())
+            tmp_path.replace(compiled_path)
+        compiled_paths[model] = compiled_path
+    return compiled_paths
+
+
+def compile_config_files(
+    paths=None,
+    cache_dir=None,
+    models=MODELS,
+    max_workers=None,
+    **kwargs,
+):
+    """Compile many configuration files in a process pool.
+
+    :param paths: configuration file paths
+    :param cache_dir: directory for compiled payloads (created if missing)
+    :param models: models to compile for
+    :param max_workers: process pool size, None for the number of CPUs
+    :param kwargs: passed to compile_config_file()
+    :return: {config path: {model: compiled payload path}}
+    """
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    paths = [str(path) for path in paths]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            path: pool.submit(
+                compile_config_file,
+                path=path,
+                cache_dir=cache_dir,
+                models=models,
+                **kwargs,
+            )
+            for path in paths
+        }
+        return {path: future.result() for path, future in futures.items()}
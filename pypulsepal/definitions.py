@@ -116,7 +116,19 @@ PARAM_DTYPE_MODEL_2 = {
     "restingVoltage": "uint16",  # v1: uint8, param: 17
     "triggerMode": "uint8",  # parma 128
 }
+PARAM_DTYPE_MODELS = {
+    1: PARAM_DTYPE_MODEL_1,
+    2: PARAM_DTYPE_MODEL_2,
+}
+DAC_BITMAX_MODELS = {
+    1: 255,
+    2: 65535,
+}
 PULSEPAL_CYCLE_FREQUENCY = 20000
+CUSTOM_TRAIN_MAX_PULSES_MODELS = {
+    1: 1000,
+    2: 10000,
+}
 PARAM_SCALING = {
     "isBiphasic": 1,
     "phase1Voltage": 1,
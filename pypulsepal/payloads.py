@@ -0,0 +1,126 @@
+"""Pure encoders for PulsePal wire payloads.
+
+Payloads start with the message header (e.g. PROGRAM_ALL) and exclude the device
+opcode, which PulsePal prepends when sending. They depend only on parameter values
+and the model, so they can be built offline and cached.
+"""
+
+import numpy as np
+
+from pypulsepal.definitions import (
+    CUSTOM_PULSE_TRAIN_OPCODES,
+    DAC_BITMAX_MODELS,
+    PARAM_DTYPE_MODELS,
+    SendMessageHeader,
+)
+from pypulsepal.utils import encode_message, volts_to_dac_codes
+
+ENCODING_UINT8 = "uint8"
+TIME_PARAM_NAMES = [
+    "phase1Duration",
+    "interPhaseInterval",
+    "phase2Duration",
+    "interPulseInterval",
+    "burstDuration",
+    "interBurstInterval",
+    "pulseTrainDuration",
+    "pulseTrainDelay",
+]
+VOLT_PARAM_NAMES = ["phase1Voltage", "phase2Voltage", "restingVoltage"]
+
+
+def _channel_table(params=None, param_names=None, nr_channels=None):
+    """Array of shape (nr_channels, len(param_names)), i.e. interleaved by channel"""
+    return np.asarray(
+        [params[param][:nr_channels] for param in param_names], dtype="float64"
+    ).T
+
+
+def encode_program_all_payload(
+    params=None,
+    model=None,
+    cycle_frequency=None,
+    nr_output_channels=4,
+    nr_trigger_channels=2,
+):
+    """Encode all channel and trigger parameters as one PROGRAM_ALL (73) payload.
+
+    :param params: dict of parameter name to list of per-channel values, including
+        "triggerMode" with per-trigger-channel values
+    :param model: PulsePal model (1 or 2), byte layout differs between models
+    :param cycle_frequency: device clock in Hz used to scale durations
+    :param nr_output_channels:
+    :param nr_trigger_channels:
+    :return: bytes
+    """
+    dac_bitMax = DAC_BITMAX_MODELS[model]
+    voltage_dtype = PARAM_DTYPE_MODELS[model]["phase1Voltage"]
+
+    # 32-bit time parameters: 8 params x channels, interleaved by channel
+    program_values_32 = np.round(
+        _channel_table(params, TIME_PARAM_NAMES, nr_output_channels) * cycle_frequency
+    ).astype("uint32")
+    volts = volts_to_dac_codes(
+        volts=_channel_table(params, VOLT_PARAM_NAMES, nr_output_channels),
+        dac_bitMax=dac_bitMax,
+        dtype=voltage_dtype,
+    )
+    flags = _channel_table(
+        params,
+        ["isBiphasic", "customTrainID", "customTrainTarget", "customTrainLoop"],
+        nr_output_channels,
+    ).astype(ENCODING_UINT8)
+
+    payload = [
+        encode_message(SendMessageHeader.PROGRAM_ALL, encoding=ENCODING_UINT8),
+        program_values_32.tobytes(),
+    ]
+    if model == 2:
+        # 16-bit voltages: 3 volt params x channels, then 4 8-bit params x channels
+        payload += [volts.tobytes(), flags.tobytes()]
+    else:
+        # model 1: voltages are uint8 and packed into the 8-bit section
+        program_values_8 = np.column_stack(
+            [flags[:, 0], volts[:, 0], volts[:, 1], flags[:, 1:], volts[:, 2]]
+        )
+        payload.append(program_values_8.astype(ENCODING_UINT8).tobytes())
+
+    # Trigger link params: linkTriggerChannel1 per channel, then linkTriggerChannel2
+    trigger_links = _channel_table(
+        params, ["linkTriggerChannel1", "linkTriggerChannel2"], nr_output_channels
+    ).T.astype(ENCODING_UINT8)
+    payload += [
+        trigger_links.tobytes(),
+        encode_message(
+            params["triggerMode"][:nr_trigger_channels], encoding=ENCODING_UINT8
+        ),
+    ]
+    return b"".join(payload)
+
+
+def encode_custom_train_payload(
+    pulse_train_id=None, pulse_times=None, pulse_voltages=None, model=None
+):
+    """Encode a custom train upload (75/76) from device-unit times and DAC codes.
+
+    :param pulse_train_id: custom train slot (0 or 1)
+    :param pulse_times: pulse onset times in device cycles
+    :param pulse_voltages: DAC codes in the model-specific voltage dtype
+    :param model: PulsePal model (1 or 2)
+    :return: bytes
+    """
+    payload = [
+        encode_message(
+            CUSTOM_PULSE_TRAIN_OPCODES.get(pulse_train_id), encoding=ENCODING_UINT8
+        )
+    ]
+    if model == 1:
+        payload.append(encode_message(0, encoding=ENCODING_UINT8))
+    payload += [
+        encode_message(len(pulse_times), encoding="uint32"),
+        encode_message(pulse_times, encoding="uint32"),
+        encode_message(
+            pulse_voltages, encoding=PARAM_DTYPE_MODELS[model]["phase1Voltage"]
+        ),
+    ]
+    return b"".join(payload)
@@ -0,0 +1,151 @@
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+
+
+class LogicPoller:
+    """Poll logic levels of several channels in the background.
+
+    Each poll cycle reads all channels with one pipelined exchange
+    (PulsePal.get_logic_levels) and calls every registered callback with
+    `(channel, level, timestamp)` for channels whose level changed since the
+    previous cycle (all channels on the first cycle). Timestamps are host
+    `time.perf_counter()` values taken when the replies of the cycle were received.
+
+    The poller uses the serial connection from its own thread: avoid other
+    PulsePal calls while it is running.
+    """
+
+    def __init__(
+        self,
+        pulsepal=None,
+        channels=None,
+        rate=100,
+        callbacks=None,
+        latency_history=10000,
+    ):
+        """
+
+        :param pulsepal: connected PulsePal object
+        :param channels: 0-indexed output channels, defaults to all output channels
+        :param rate: target poll cycles per second
+        :param callbacks: callables with signature (channel, level, timestamp)
+        :param latency_history: number of most recent cycle latencies to keep
+        """
+        self.pulsepal = pulsepal
+        if channels is None:
+            channels = range(pulsepal.nr_output_channels)
+        self.channels = list(channels)
+        self.rate = rate
+        self.callbacks = list(callbacks or [])
+
+        self.levels = None
+        self.error = None
+        self.n_cycles = 0
+        self.cycle_latencies = collections.deque(maxlen=latency_history)
+        self.start_time = None
+        self.stop_time = None
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def add_callback(self, callback=None):
+        self.callbacks.append(callback)
+
+    def poll_once(self):
+        """Run one poll cycle and fire callbacks for changed levels.
+
+        :return: numpy array of current logic levels
+        """
+        cycle_start = time.perf_counter()
+        levels = self.pulsepal.get_logic_levels(channels=self.channels)
+        timestamp = time.perf_counter()
+
+        self.cycle_latencies.append(timestamp - cycle_start)
+        self.n_cycles += 1
+
+        if self.levels is None:
+            changed = range(len(self.channels))
+        else:
+            changed = np.flatnonzero(levels != self.levels)
+        self.levels = levels
+
+        for index in changed:
+            for callback in self.callbacks:
+                callback(self.channels[index], int(levels[index]), timestamp)
+
+        return levels
+
+    def _run(self):
+        period = 1.0 / self.rate
+        next_cycle = time.perf_counter()
+        while not self._stop_event.is_set():
+            try:
+                self.poll_once()
+            except Exception as error:
+                self.error = error
+                logging.exception("Logic polling stopped after error")
+                break
+            next_cycle += period
+            delay = next_cycle - time.perf_counter()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                # Fell behind: restart pacing from now instead of bursting
+                next_cycle = time.perf_counter()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self.error = None
+        self.start_time = time.perf_counter()
+        self.stop_time = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1):
+        """Stop polling and return report(); re-raises the error that ended polling"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self.stop_time = time.perf_counter()
+        if self.error is not None:
+            raise self.error
+        return self.report()
+
+    def report(self):
+        """Sustained poll rate and per-cycle latency statistics.
+
+        :return: dict with cycle count, achieved rate and latency percentiles
+        """
+        end_time = self.stop_time or time.perf_counter()
+        duration = end_time - self.start_time if self.start_time else 0.0
+        latencies = np.asarray(self.cycle_latencies, dtype="float64")
+        report = {
+            "n_cycles": self.n_cycles,
+            "duration": duration,
+            "target_rate": self.rate,
+            "achieved_rate": self.n_cycles / duration if duration > 0 else 0.0,
+            "error": repr(self.error) if self.error is not None else None,
+        }
+        if latencies.size:
+            report.update(
+                {
+                    "latency_mean": float(latencies.mean()),
+                    "latency_p50": float(np.percentile(latencies, 50)),
+                    "latency_p95": float(np.percentile(latencies, 95)),
+                    "latency_max": float(latencies.max()),
+                }
+            )
+        return report
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -1,12 +1,17 @@
+import contextlib
+import functools
+import itertools
 import logging
+import time
 
+import numpy as np
 from pybpodapi.com.arcom import ArCOM
 
+from pypulsepal.configs import CompiledPayload
 from pypulsepal.definitions import (
     CHANNEL_PARAM_DEFAULTS,
-    CUSTOM_PULSE_TRAIN_OPCODES,
-    PARAM_DTYPE_MODEL_1,
-    PARAM_DTYPE_MODEL_2,
+    DAC_BITMAX_MODELS,
+    PARAM_DTYPE_MODELS,
     PARAM_SCALING,
     PULSEPAL_CYCLE_FREQUENCY,
     TRIGGER_PARAM_DEFAULTS,
@@ -15,7 +20,12 @@ from pypulsepal.definitions import (
     resolve_param_name_code_pair,
     resolve_trigger_name_code_pair,
 )
-from pypulsepal.utils import encode_message, volts_to_bytes
+from pypulsepal.payloads import (
+    encode_custom_train_payload,
+    encode_program_all_payload,
+)
+from pypulsepal.snapshot import pack_snapshot, unpack_snapshot
+from pypulsepal.utils import encode_message, volts_to_bytes, volts_to_dac_codes
 
 ENCODING_UINT8 = "uint8"
 
@@ -26,6 +36,23 @@ class PulsePalError(Exception):
     pass
 
 
+def reconnect_on_error(method):
+    """Reconnect and retry once on serial errors if auto_reconnect is enabled"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except OSError:
+            if not self.auto_reconnect or self._reconnecting:
+                raise
+            logging.warning(f"Serial error in {method.__name__}, reconnecting")
+            self.reconnect()
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class PulsePal:
     """"""
 
@@ -44,6 +71,12 @@ class PulsePal:
     opcode = 213
     param_dtype_lookup = None
 
+    # client state
+    custom_trains = None
+    auto_reconnect = False
+    last_recovery_time = None
+    _reconnecting = False
+
     def __init__(
         self,
         serial_port=None,
@@ -52,6 +85,7 @@ class PulsePal:
         nr_output_channels=4,
         nr_trigger_channels=2,
         opcode=213,
+        arcom=None,
         **kwargs,
     ):
         """
@@ -61,6 +95,8 @@ class PulsePal:
         :param cycle_frequency:
         :param nr_output_channels:
         :param nr_trigger_channels:
+        :param arcom: ArCOM-like transport to use instead of opening serial_port,
+            e.g. pypulsepal.simulation.SimulatedArCOM
         :param kwargs:
         """
         super().__init__()
@@ -72,6 +108,9 @@ class PulsePal:
         for param, default_value in TRIGGER_PARAM_DEFAULTS.items():
             setattr(self, param, [default_value] * self.nr_trigger_channels)
 
+        # Encoded custom trains by slot, as last uploaded
+        self.custom_trains = {}
+
         # Args
         self.serial_port = serial_port
         self.baudrate = baudrate
@@ -85,7 +124,7 @@ class PulsePal:
             if hasattr(self, k):
                 setattr(self, k, v)
 
-        self.connect(serial_port=serial_port, baudrate=baudrate)
+        self.connect(serial_port=serial_port, baudrate=baudrate, arcom=arcom)
 
     @property
     def encoded_opcode(self):
@@ -118,14 +157,9 @@ class PulsePal:
         handshake_ok = handshake == ReceiveMessageHeader.HANDSHAKE_OK
         if handshake_ok:
             self.firmware_version = firmware_version
-            if firmware_version < 20:
-                self.model = 1
-                self.dac_bitMax = 255
-                self.param_dtype_lookup = PARAM_DTYPE_MODEL_1
-            else:
-                self.model = 2
-                self.dac_bitMax = 65535
-                self.param_dtype_lookup = PARAM_DTYPE_MODEL_2
+            self.model = 1 if firmware_version < 20 else 2
+            self.dac_bitMax = DAC_BITMAX_MODELS[self.model]
+            self.param_dtype_lookup = PARAM_DTYPE_MODELS[self.model]
             if firmware_version == 20:
                 logging.warning(
                     "Firmware v20 has a bug in Pulse Gated trigger mode when used with "
@@ -140,15 +174,16 @@ class PulsePal:
 
         return bool(handshake_ok)
 
-    def connect(self, serial_port, baudrate=115200, timeout=1):
+    def connect(self, serial_port, baudrate=115200, timeout=1, arcom=None):
         """Connect (& handshake) with hardware
 
         :param serial_port:
         :param baudrate:
         :param timeout:
+        :param arcom: optional ArCOM-like transport (default: new pybpodapi ArCOM)
         :return:
         """
-        self._arcom = ArCOM().open(
+        self._arcom = (arcom or ArCOM()).open(
             serial_port=serial_port, baudrate=baudrate, timeout=timeout
         )
         handshake_ok = self._pulsepal_handshake()
@@ -175,6 +210,7 @@ class PulsePal:
         attr[channel] = param_value
         setattr(self, param_name, attr)
 
+    @reconnect_on_error
     def program_one_param(self, channel=None, param_name=None, param_value=None):
         """Program one channel parameter (one parameter on one channel)."""
         param_name, param_code = resolve_param_name_code_pair(
@@ -185,6 +221,9 @@ class PulsePal:
             PARAM_SCALING.get(param_name),
         )
 
+        # Keep the unscaled value for the client-side parameter lists
+        raw_param_value = param_value
+
         logging.debug(f"Param value before voltage-to-bit correction: {param_value}")
         if "volt" in param_name.lower():
             param_value = volts_to_bytes(volt=param_value, dac_bitMax=self.dac_bitMax)
@@ -205,7 +244,7 @@ class PulsePal:
         write_ok = self._read_confirmation()
         if write_ok:
             self._update_param(
-                channel=channel, param_name=param_name, param_value=param_value
+                channel=channel, param_name=param_name, param_value=raw_param_value
             )
 
         return write_ok
@@ -255,107 +294,25 @@ class PulsePal:
             if not success:
                 raise ValueError
 
+    @reconnect_on_error
     def sync_all_params(self):
         """Upload all parameters in a single bulk serial write (opcode 73).
 
         Faster than upload_all() which does one serial round trip per parameter.
         Byte layout differs between model 1 and model 2.
         """
-        time_param_names = [
-            "phase1Duration",
-            "interPhaseInterval",
-            "phase2Duration",
-            "interPulseInterval",
-            "burstDuration",
-            "interBurstInterval",
-            "pulseTrainDuration",
-            "pulseTrainDelay",
-        ]
-        volt_param_names = ["phase1Voltage", "phase2Voltage", "restingVoltage"]
-
-        # 32-bit time parameters: 8 params × 4 channels, interleaved by channel
-        program_values_32 = []
-        for channel in range(self.nr_output_channels):
-            for param in time_param_names:
-                program_values_32.append(
-                    int(getattr(self, param)[channel] * self.cycle_frequency)
-                )
-
-        # Voltage and 8-bit parameters differ by model
-        if self.model == 2:
-            # 16-bit voltages: 3 volt params × 4 channels
-            program_values_16 = []
-            for channel in range(self.nr_output_channels):
-                for param in volt_param_names:
-                    program_values_16.append(
-                        int(
-                            volts_to_bytes(
-                                volt=getattr(self, param)[channel],
-                                dac_bitMax=self.dac_bitMax,
-                            )
-                        )
-                    )
-            # 8-bit params: 4 params × 4 channels
-            program_values_8 = []
-            for channel in range(self.nr_output_channels):
-                program_values_8.append(int(self.isBiphasic[channel]))
-                program_values_8.append(int(self.customTrainID[channel]))
-                program_values_8.append(int(self.customTrainTarget[channel]))
-                program_values_8.append(int(self.customTrainLoop[channel]))
-        else:  # model 1: voltages are uint8 and packed into the 8-bit section
-            program_values_16 = None
-            program_values_8 = []
-            for channel in range(self.nr_output_channels):
-                program_values_8.append(int(self.isBiphasic[channel]))
-                program_values_8.append(
-                    int(
-                        volts_to_bytes(
-                            volt=self.phase1Voltage[channel], dac_bitMax=self.dac_bitMax
-                        )
-                    )
-                )
-                program_values_8.append(
-                    int(
-                        volts_to_bytes(
-                            volt=self.phase2Voltage[channel], dac_bitMax=self.dac_bitMax
-                        )
-                    )
-                )
-                program_values_8.append(int(self.customTrainID[channel]))
-                program_values_8.append(int(self.customTrainTarget[channel]))
-                program_values_8.append(int(self.customTrainLoop[channel]))
-                program_values_8.append(
-                    int(
-                        volts_to_bytes(
-                            volt=self.restingVoltage[channel],
-                            dac_bitMax=self.dac_bitMax,
-                        )
-                    )
-                )
-
-        # Trigger link params: linkTriggerChannel1 per channel, then linkTriggerChannel2
-        program_values_tl = [
-            int(self.linkTriggerChannel1[ch]) for ch in range(self.nr_output_channels)
-        ] + [int(self.linkTriggerChannel2[ch]) for ch in range(self.nr_output_channels)]
-
-        # Trigger modes for all trigger channels
-        trigger_modes = [
-            int(self.triggerMode[ch]) for ch in range(self.nr_trigger_channels)
-        ]
-
-        message = [
-            self.encoded_opcode,
-            encode_message(SendMessageHeader.PROGRAM_ALL, encoding=ENCODING_UINT8),
-            encode_message(program_values_32, encoding="uint32"),
-        ]
-        if program_values_16 is not None:
-            message.append(encode_message(program_values_16, encoding="uint16"))
-        message += [
-            encode_message(program_values_8, encoding=ENCODING_UINT8),
-            encode_message(program_values_tl, encoding=ENCODING_UINT8),
-            encode_message(trigger_modes, encoding=ENCODING_UINT8),
-        ]
-        self._arcom.write_array(b"".join(message))
+        params = {
+            param: getattr(self, param)
+            for param in [*CHANNEL_PARAM_DEFAULTS, *TRIGGER_PARAM_DEFAULTS]
+        }
+        payload = encode_program_all_payload(
+            params=params,
+            model=self.model,
+            cycle_frequency=self.cycle_frequency,
+            nr_output_channels=self.nr_output_channels,
+            nr_trigger_channels=self.nr_trigger_channels,
+        )
+        self._arcom.write_array(self.encoded_opcode + payload)
         return self._read_confirmation()
 
     def set_resting_voltage(self, channel=None, voltage=None):
@@ -372,6 +329,7 @@ class PulsePal:
         )
         return write_ok
 
+    @reconnect_on_error
     def set_fixed_voltage(self, channel=None, voltage=None):
         """Set a channel to a fixed DC voltage immediately, outside of any pulse train.
 
@@ -396,40 +354,221 @@ class PulsePal:
         self._arcom.write_array(b"".join(message))
         return self._read_confirmation()
 
-    def upload_custom_pulse_train(
+    def _encode_fixed_voltage_messages(self, channels=None, voltages=None):
+        """Encode a block of PROGRAM_VOLT messages in one go.
+
+        :param channels: 0-indexed output channels, one per column of `voltages`
+        :param voltages: array of shape (n_samples, n_channels) in volts
+        :return: list with one bytes message (all channels) per sample
+        """
+        voltage_dtype = self.param_dtype_lookup.get("phase1Voltage")
+        message_dtype = np.dtype(
+            [
+                ("opcode", ENCODING_UINT8),
+                ("header", ENCODING_UINT8),
+                ("channel", ENCODING_UINT8),
+                ("voltage", voltage_dtype),
+            ]
+        )
+        n_samples, n_channels = voltages.shape
+        messages = np.empty((n_samples, n_channels), dtype=message_dtype)
+        messages["opcode"] = self.opcode
+        messages["header"] = SendMessageHeader.PROGRAM_VOLT
+        messages["channel"] = np.asarray(channels) + 1
+        messages["voltage"] = volts_to_dac_codes(
+            volts=voltages, dac_bitMax=self.dac_bitMax, dtype=voltage_dtype
+        )
+        sample_nbytes = n_channels * message_dtype.itemsize
+        buffer = messages.tobytes()
+        return [
+            buffer[start : start + sample_nbytes]
+            for start in range(0, len(buffer), sample_nbytes)
+        ]
+
+    def _encode_voltage_blocks(self, channels=None, blocks=None):
+        """Yield encoded PROGRAM_VOLT messages per non-empty block of voltages"""
+        for block in blocks:
+            if block.size == 0:
+                return
+            block = block.reshape(len(block), -1)
+            if block.shape[1] != channels.size:
+                raise PulsePalError(
+                    f"Got {block.shape[1]} voltages per sample "
+                    f"for {channels.size} channels"
+                )
+            yield self._encode_fixed_voltage_messages(channels=channels, voltages=block)
+
+    def _read_confirmations(self, n_confirmations=None):
+        """Read `n_confirmations` pending confirmation bytes in one serial read.
+
+        :return: number of failed confirmations
+        """
+        if not n_confirmations:
+            return 0
+        replies = self._arcom.serial_object.read(n_confirmations)
+        replies = np.frombuffer(replies, dtype=ENCODING_UINT8)
+        n_missing = n_confirmations - replies.size
+        return int(np.count_nonzero(replies != 1)) + n_missing
+
+    def stream_voltages(
+        self,
+        channels=None,
+        voltages=None,
+        rate=None,
+        max_in_flight=64,
+        drop_late=True,
+        block_size=256,
+    ):
+        """Stream host-timed voltages to output channels via PROGRAM_VOLT (opcode 79).
+
+        Voltages are converted to DAC codes and encoded in blocks, writes are paced
+        to `rate` samples per second and confirmations are read back in batches
+        instead of after every write. A sample whose deadline has already passed
+        by more than one sample period is dropped (`drop_late=True`) or sent late.
+
+        :param channels: 0-indexed output channel or list of channels
+        :param voltages: array-like of shape (n_samples,) or (n_samples, n_channels),
+            or an iterable yielding one voltage (or one per channel) per sample
+        :param rate: target update rate in samples per second
+        :param max_in_flight: maximum number of samples (one message per channel
+            each) sent but not yet confirmed
+        :param drop_late: skip samples that missed their deadline by > 1 period
+        :param block_size: number of samples encoded at once from an iterable
+        :return: dict with sample counts, achieved rate and lateness statistics
+        """
+        if rate is None or rate <= 0:
+            raise PulsePalError(f"Streaming needs a positive target rate, got {rate}")
+        channels = np.atleast_1d(channels).astype(int)
+        period = 1.0 / rate
+        max_unconfirmed = max_in_flight * channels.size
+
+        if isinstance(voltages, (np.ndarray, list, tuple)):
+            blocks = [np.asarray(voltages, dtype="float64")]
+        else:
+            voltages = iter(voltages)
+            blocks = (
+                np.asarray(
+                    list(itertools.islice(voltages, block_size)), dtype="float64"
+                )
+                for _ in itertools.count()
+            )
+        encoded_blocks = self._encode_voltage_blocks(channels=channels, blocks=blocks)
+
+        n_samples = n_sent = n_dropped = n_late = n_failed = in_flight = 0
+        max_lateness = 0.0
+        start_time = None
+        # Encode ahead: the first block before the clock starts, each next block
+        # right after the first sample of the current one, while waiting anyway
+        next_messages = next(encoded_blocks, None)
+        while next_messages is not None:
+            messages, next_messages = next_messages, None
+            for index, message in enumerate(messages):
+                if index == 1:
+                    next_messages = next(encoded_blocks, None)
+                if start_time is None:
+                    start_time = time.perf_counter()
+                deadline = start_time + n_samples * period
+                n_samples += 1
+
+                now = time.perf_counter()
+                if now < deadline:
+                    time.sleep(deadline - now)
+                    now = time.perf_counter()
+                lateness = now - deadline
+                max_lateness = max(max_lateness, lateness)
+                if lateness > period:
+                    n_late += 1
+                    if drop_late:
+                        n_dropped += 1
+                        continue
+
+                self._arcom.write_array(message)
+                n_sent += 1
+                in_flight += channels.size
+
+                # Drain whatever has arrived, block only if the pipeline is full
+                n_available = min(self._arcom.bytes_available(), in_flight)
+                if in_flight > max_unconfirmed:
+                    n_available = max(n_available, in_flight - max_unconfirmed)
+                n_failed += self._read_confirmations(n_confirmations=n_available)
+                in_flight -= n_available
+            if len(messages) == 1:
+                next_messages = next(encoded_blocks, None)
+
+        n_failed += self._read_confirmations(n_confirmations=in_flight)
+        duration = time.perf_counter() - start_time if start_time else 0.0
+
+        report = {
+            "n_samples": n_samples,
+            "n_sent": n_sent,
+            "n_dropped": n_dropped,
+            "n_late": n_late,
+            "n_failed": n_failed,
+            "duration": duration,
+            "target_rate": rate,
+            "achieved_rate": n_sent / duration if duration > 0 else 0.0,
+            "max_lateness": max_lateness,
+        }
+        logging.debug(f"Voltage stream report: {report}")
+        return report
+
+    @reconnect_on_error
+    def upload_encoded_custom_train(
         self, pulse_train_id=None, pulse_times=None, pulse_voltages=None
     ):
-        """"""
+        """Upload a custom pulse train that is already in device units.
+
+        No conversion is done: e.g. buffers from pypulsepal.waveforms are sent as is.
+
+        :param pulse_train_id: custom train slot (0 or 1)
+        :param pulse_times: pulse onset times in device cycles (uint32)
+        :param pulse_voltages: DAC codes in the model-specific voltage dtype
+        """
         assert pulse_train_id in [0, 1]
         assert len(pulse_times) == len(pulse_voltages)
 
-        scaled_pulse_times = []
-        scaled_pulse_voltages = []
-        for pulse_time, pulse_voltage in zip(pulse_times, pulse_voltages):
-            scaled_pulse_times.append(pulse_time * self.cycle_frequency)
-            scaled_pulse_voltages.append(
-                volts_to_bytes(volt=pulse_voltage, dac_bitMax=self.dac_bitMax)
+        voltage_dtype = self.param_dtype_lookup.get("phase1Voltage")
+        if np.asarray(pulse_voltages).dtype != voltage_dtype:
+            raise PulsePalError(
+                f"Model {self.model} expects {voltage_dtype} DAC codes, "
+                f"got {np.asarray(pulse_voltages).dtype}"
             )
 
-        message = [
-            self.encoded_opcode,
-            encode_message(
-                CUSTOM_PULSE_TRAIN_OPCODES.get(pulse_train_id),
-                encoding=ENCODING_UINT8,
-            ),
-        ]
-        if self.model == 1:
-            message.append(encode_message(0, encoding=ENCODING_UINT8))
-        message += [
-            encode_message(len(scaled_pulse_times), encoding="uint32"),
-            encode_message(scaled_pulse_times, encoding="uint32"),
-            encode_message(
-                scaled_pulse_voltages,
-                encoding=self.param_dtype_lookup.get("phase1Voltage"),
-            ),
-        ]
-        self._arcom.write_array(b"".join(message))
-        return self._read_confirmation()
+        payload = encode_custom_train_payload(
+            pulse_train_id=pulse_train_id,
+            pulse_times=pulse_times,
+            pulse_voltages=pulse_voltages,
+            model=self.model,
+        )
+        self._arcom.write_array(self.encoded_opcode + payload)
+        write_ok = self._read_confirmation()
+        if write_ok:
+            self.custom_trains[pulse_train_id] = (
+                np.array(pulse_times, dtype="uint32"),
+                np.array(pulse_voltages, dtype=voltage_dtype),
+            )
+        return write_ok
+
+    def upload_custom_pulse_train(
+        self, pulse_train_id=None, pulse_times=None, pulse_voltages=None
+    ):
+        """"""
+        assert pulse_train_id in [0, 1]
+        assert len(pulse_times) == len(pulse_voltages)
+
+        scaled_pulse_times = np.round(
+            np.asarray(pulse_times, dtype="float64") * self.cycle_frequency
+        ).astype("uint32")
+        scaled_pulse_voltages = volts_to_dac_codes(
+            volts=pulse_voltages,
+            dac_bitMax=self.dac_bitMax,
+            dtype=self.param_dtype_lookup.get("phase1Voltage"),
+        )
+        return self.upload_encoded_custom_train(
+            pulse_train_id=pulse_train_id,
+            pulse_times=scaled_pulse_times,
+            pulse_voltages=scaled_pulse_voltages,
+        )
 
     def upload_custom_waveform(
         self, pulse_train_id=None, pulse_width=None, pulse_voltages=None
@@ -437,35 +576,76 @@ class PulsePal:
         """"""
         assert pulse_train_id in [0, 1]
 
-        scaled_pulse_times = []
-        scaled_pulse_voltages = []
-        for pulse_index, pulse_voltage in enumerate(pulse_voltages):
-            pulse_time = pulse_index * pulse_width * self.cycle_frequency
-            scaled_pulse_times.append(pulse_time)
-            scaled_pulse_voltages.append(
-                volts_to_bytes(volt=pulse_voltage, dac_bitMax=self.dac_bitMax)
+        pulse_times = np.arange(len(pulse_voltages)) * pulse_width
+        return self.upload_custom_pulse_train(
+            pulse_train_id=pulse_train_id,
+            pulse_times=pulse_times,
+            pulse_voltages=pulse_voltages,
+        )
+
+    def upload_compiled_sequence(self, compiled_sequence=None, trigger=False):
+        """Upload a sequence from pypulsepal.sequences.compile_pulse_sequences().
+
+        Custom trains are uploaded as encoded, the channel parameters are updated and
+        written with one sync_all_params() call.
+
+        :param compiled_sequence: CompiledSequence
+        :param trigger: start the sequence on all its channels after uploading
+        :return: upload success bool
+        """
+        upload_ok = True
+        for slot, (pulse_times, pulse_voltages) in sorted(
+            compiled_sequence.custom_trains.items()
+        ):
+            upload_ok &= self.upload_encoded_custom_train(
+                pulse_train_id=slot,
+                pulse_times=pulse_times,
+                pulse_voltages=pulse_voltages,
             )
+        for channel, params in compiled_sequence.channel_params.items():
+            for param_name, param_value in params.items():
+                self._update_param(
+                    channel=channel, param_name=param_name, param_value=param_value
+                )
+        upload_ok &= self.sync_all_params()
 
-        message = [
-            self.encoded_opcode,
-            encode_message(
-                CUSTOM_PULSE_TRAIN_OPCODES.get(pulse_train_id),
-                encoding=ENCODING_UINT8,
-            ),
-        ]
-        if self.model == 1:
-            message.append(encode_message(0, encoding=ENCODING_UINT8))
-        message += [
-            encode_message(len(scaled_pulse_times), encoding="uint32"),
-            encode_message(scaled_pulse_times, encoding="uint32"),
-            encode_message(
-                scaled_pulse_voltages,
-                encoding=self.param_dtype_lookup.get("phase1Voltage"),
-            ),
-        ]
-        self._arcom.write_array(b"".join(message))
+        if upload_ok and trigger:
+            self.trigger_selected_channels(**compiled_sequence.trigger_kwargs)
+        return bool(upload_ok)
+
+    @reconnect_on_error
+    def _send_payload(self, payload=None):
+        """Send one pre-encoded payload and return its confirmation"""
+        self._arcom.write_array(self.encoded_opcode + payload)
         return self._read_confirmation()
 
+    def send_compiled_payload(self, compiled_payload=None):
+        """Send a payload compiled offline by pypulsepal.configs, without re-encoding.
+
+        :param compiled_payload: CompiledPayload or path to a compiled payload file
+        :return: upload success bool
+        """
+        if not isinstance(compiled_payload, CompiledPayload):
+            compiled_payload = CompiledPayload.load(path=compiled_payload)
+        metadata = compiled_payload.metadata
+        for attr in ["model", "nr_output_channels", "nr_trigger_channels"]:
+            if metadata[attr] != getattr(self, attr):
+                raise PulsePalError(
+                    f"Payload compiled for {attr} {metadata[attr]}, "
+                    f"connected device has {getattr(self, attr)}"
+                )
+
+        upload_ok = True
+        for segment in compiled_payload.segments:
+            upload_ok &= self._send_payload(payload=segment)
+
+        if upload_ok:
+            self.cycle_frequency = metadata["cycle_frequency"]
+            for param, values in metadata["params"].items():
+                setattr(self, param, list(values))
+            self.custom_trains.update(compiled_payload.custom_trains())
+        return bool(upload_ok)
+
     def set_continuous(self, channel=None, state=None):
         """"""
         message = [
@@ -477,6 +657,7 @@ class PulsePal:
         self._arcom.write_array(b"".join(message))
         return self._read_confirmation()
 
+    @reconnect_on_error
     def set_logic(self, channel=None, level=None):
         """Set Arduino digital logic level on an output channel (model 2, opcode 86).
 
@@ -492,6 +673,7 @@ class PulsePal:
         self._arcom.write_array(b"".join(message))
         return self._read_confirmation()
 
+    @reconnect_on_error
     def get_logic(self, channel=None):
         """Read current Arduino digital logic level on an output channel (opcode 87).
 
@@ -506,6 +688,43 @@ class PulsePal:
         self._arcom.write_array(b"".join(message))
         return self._arcom.read_uint8()
 
+    @reconnect_on_error
+    def get_logic_levels(self, channels=None):
+        """Read logic levels of several output channels in one pipelined exchange.
+
+        All LOGIC_GET requests (opcode 87) are written at once and the replies are
+        read back together, instead of one round trip per channel as in get_logic().
+
+        :param channels: 0-indexed output channels, defaults to all output channels
+        :return: numpy array of logic levels (0 or 1), ordered like `channels`
+        """
+        if channels is None:
+            channels = range(self.nr_output_channels)
+        channels = np.asarray(channels, dtype=int)
+
+        messages = np.empty(
+            channels.size,
+            dtype=[
+                ("opcode", ENCODING_UINT8),
+                ("header", ENCODING_UINT8),
+                ("channel", ENCODING_UINT8),
+            ],
+        )
+        messages["opcode"] = self.opcode
+        messages["header"] = SendMessageHeader.LOGIC_GET
+        messages["channel"] = channels + 1
+        self._arcom.write_array(messages.tobytes())
+
+        replies = self._arcom.serial_object.read(channels.size)
+        if len(replies) != channels.size:
+            # Drop late replies so they do not shift later reads
+            self._clear_read_queue()
+            raise PulsePalError(
+                f"Expected {channels.size} logic levels, received {len(replies)}"
+            )
+        return np.frombuffer(replies, dtype=ENCODING_UINT8)
+
+    @reconnect_on_error
     def trigger_selected_channels(
         self,
         channel_1=False,
@@ -536,6 +755,7 @@ class PulsePal:
             channel_1=True, channel_2=True, channel_3=True, channel_4=True
         )
 
+    @reconnect_on_error
     def stop_all_outputs(self):
         """"""
         message = [
@@ -556,15 +776,119 @@ class PulsePal:
         self._arcom.write_array(b"".join(message))
         return self._read_confirmation()  # fixme: returns False
 
+    def snapshot(self, include_custom_trains=True):
+        """Compact binary snapshot of the client state (see pypulsepal.snapshot).
+
+        :param include_custom_trains: include train contents, otherwise digests only
+        :return: bytes
+        """
+        return pack_snapshot(pulsepal=self, include_custom_trains=include_custom_trains)
+
+    def restore_snapshot(self, snapshot=None, upload=True):
+        """Restore client state from a snapshot and optionally push it to the device.
+
+        Parameters are uploaded with a single sync_all_params() bulk write, custom
+        trains are re-uploaded if their contents are in the snapshot.
+
+        :param snapshot: bytes from snapshot()
+        :param upload: write restored state to the device
+        :return: dict with upload success and slots of custom trains that could not
+            be restored because only their digest is in the snapshot
+        """
+        state = unpack_snapshot(data=snapshot)
+        for attr in ["model", "nr_output_channels", "nr_trigger_channels"]:
+            if state[attr] != getattr(self, attr):
+                raise PulsePalError(
+                    f"Snapshot {attr} {state[attr]} does not match "
+                    f"connected device ({getattr(self, attr)})"
+                )
+        if state["firmware_version"] != self.firmware_version:
+            logging.warning(
+                f"Restoring snapshot of firmware v{state['firmware_version']} "
+                f"on firmware v{self.firmware_version}"
+            )
+        self.cycle_frequency = state["cycle_frequency"]
+        for param, values in {
+            **state["channel_params"],
+            **state["trigger_params"],
+        }.items():
+            setattr(self, param, values)
+
+        missing_trains = [
+            slot
+            for slot, train in state["custom_trains"].items()
+            if train["pulse_times"] is None
+        ]
+        if missing_trains:
+            logging.warning(
+                f"Snapshot has no contents for custom trains {missing_trains}"
+            )
+
+        upload_ok = True
+        if upload:
+            for slot, train in state["custom_trains"].items():
+                if train["pulse_times"] is not None:
+                    upload_ok &= self.upload_encoded_custom_train(
+                        pulse_train_id=slot,
+                        pulse_times=train["pulse_times"],
+                        pulse_voltages=train["pulse_voltages"],
+                    )
+            upload_ok &= self.sync_all_params()
+
+        return {"success": bool(upload_ok), "missing_trains": missing_trains}
+
+    def reconnect(self, snapshot=None):
+        """Reopen the connection and bring the device back to the client state.
+
+        The current client state is snapshotted (unless `snapshot` is given), the
+        port is reopened and the handshake repeated. The firmware reported by the
+        handshake must match the snapshot, then all state is restored.
+
+        :param snapshot: bytes from snapshot(), defaults to the current state
+        :return: dict with success, recovery time in seconds and missing trains
+        """
+        start_time = time.perf_counter()
+        snapshot = snapshot or self.snapshot()
+        firmware_version = unpack_snapshot(data=snapshot)["firmware_version"]
+
+        self._reconnecting = True
+        try:
+            arcom, self._arcom = self._arcom, None
+            if arcom is not None:
+                with contextlib.suppress(OSError):
+                    arcom.close()
+            self.connect(
+                serial_port=self.serial_port, baudrate=self.baudrate, arcom=arcom
+            )
+            if self.firmware_version != firmware_version:
+                raise PulsePalError(
+                    f"Reconnected to firmware v{self.firmware_version}, "
+                    f"expected v{firmware_version}"
+                )
+            result = self.restore_snapshot(snapshot=snapshot, upload=True)
+        finally:
+            self._reconnecting = False
+
+        self.last_recovery_time = time.perf_counter() - start_time
+        result["recovery_time"] = self.last_recovery_time
+        logging.info(f"Reconnected PulsePal in {self.last_recovery_time:.3f} s")
+        return result
+
+    def disconnect(self):
+        """Save settings and close the connection. Safe to call more than once."""
+        if self._arcom is None:
+            return
+        try:
+            self.save_settings()
+        finally:
+            self._arcom.close()
+            self._arcom = None
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.save_settings()
-        if self._arcom is not None:
-            self._arcom.close()
+        self.disconnect()
 
     def __del__(self):
-        self.save_settings()
-        if self._arcom is not None:
-            self._arcom.close()
+        self.disconnect()
@@ -0,0 +1,172 @@
+"""Compile host-timed pulse sequences into on-device custom pulse trains.
+
+Instead of triggering every pulse from a host loop, the onsets, widths and
+amplitudes of a sequence are quantized to the device clock and turned into one
+custom train per distinct sequence. The device then plays the whole sequence from
+a single trigger.
+
+A custom train pulse lasts phase1Duration. If all pulses of a channel have the same
+width, phase1Duration is set to that width and every pulse is one train entry.
+Otherwise phase1Duration is set to the greatest common divisor of the widths and
+each pulse is split into back-to-back entries of that length.
+"""
+
+import numpy as np
+
+from pypulsepal.definitions import (
+    CUSTOM_PULSE_TRAIN_OPCODES,
+    CUSTOM_TRAIN_MAX_PULSES_MODELS,
+    DAC_BITMAX_MODELS,
+    PARAM_DTYPE_MODELS,
+    PULSEPAL_CYCLE_FREQUENCY,
+)
+from pypulsepal.utils import volts_to_dac_codes
+
+
+class CompiledSequence:
+    """Custom trains and channel parameters that play a pulse sequence"""
+
+    def __init__(self, custom_trains=None, channel_params=None, report=None):
+        """
+
+        :param custom_trains: {slot: (pulse_times, pulse_voltages)} in device units
+        :param channel_params: {channel: {param_name: value}}
+        :param report: dict with slot usage and quantization statistics
+        """
+        self.custom_trains = custom_trains
+        self.channel_params = channel_params
+        self.report = report
+
+    @property
+    def channels(self):
+        return sorted(self.channel_params)
+
+    @property
+    def trigger_kwargs(self):
+        """Keyword arguments for PulsePal.trigger_selected_channels()"""
+        return {f"channel_{channel + 1}": True for channel in self.channels}
+
+
+def _compile_channel(onsets=None, widths=None, amplitudes=None, cycle_frequency=None):
+    """Quantize one channel's pulses and expand them to custom train entries"""
+    onsets = np.asarray(onsets, dtype="float64")
+    if onsets.size == 0:
+        raise ValueError("Sequence needs at least one pulse onset")
+    widths = np.broadcast_to(np.asarray(widths, dtype="float64"), onsets.shape)
+    amplitudes = np.broadcast_to(np.asarray(amplitudes, dtype="float64"), onsets.shape)
+    order = np.argsort(onsets, kind="stable")
+    onsets, widths, amplitudes = onsets[order], widths[order], amplitudes[order]
+
+    onset_cycles = np.round(onsets * cycle_frequency).astype("int64")
+    width_cycles = np.round(widths * cycle_frequency).astype("int64")
+    if np.any(onset_cycles < 0) or np.any(width_cycles < 1):
+        raise ValueError("Onsets must be >= 0 and widths at least one device cycle")
+    if np.any(onset_cycles[:-1] + width_cycles[:-1] > onset_cycles[1:]):
+        raise ValueError("Pulses overlap after quantization to the device clock")
+
+    errors = np.concatenate(
+        [
+            onset_cycles / cycle_frequency - onsets,
+            width_cycles / cycle_frequency - widths,
+        ]
+    )
+
+    step_cycles = int(np.gcd.reduce(width_cycles))
+    n_steps = width_cycles // step_cycles
+    step_offsets = np.arange(n_steps.sum()) - np.repeat(
+        np.cumsum(n_steps) - n_steps, n_steps
+    )
+    pulse_times = np.repeat(onset_cycles, n_steps) + step_offsets * step_cycles
+    pulse_voltages = np.repeat(amplitudes, n_steps)
+    end_cycles = int(onset_cycles[-1] + width_cycles[-1])
+
+    return pulse_times, pulse_voltages, step_cycles, end_cycles, errors
+
+
+def compile_pulse_sequences(
+    sequences=None,
+    model=2,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+    loop_duration=None,
+):
+    """Compile per-channel pulse sequences into at most two custom trains.
+
+    :param sequences: {channel: {"onsets": [...], "widths": ..., "amplitudes": ...}}
+        with 0-indexed output channels, times in seconds and amplitudes in volts;
+        widths and amplitudes may be scalars
+    :param model: PulsePal model (1 or 2), sets DAC dtype and train length limit
+    :param cycle_frequency: device clock in Hz
+    :param loop_duration: if set, loop the trains for this many seconds
+    :return: CompiledSequence
+    """
+    max_pulses = CUSTOM_TRAIN_MAX_PULSES_MODELS[model]
+    voltage_dtype = PARAM_DTYPE_MODELS[model]["phase1Voltage"]
+
+    slots = {}  # train key -> slot
+    custom_trains = {}
+    channel_params = {}
+    slot_report = {}
+    all_errors = []
+    for channel, sequence in sorted(sequences.items()):
+        pulse_times, pulse_voltages, step_cycles, end_cycles, errors = _compile_channel(
+            onsets=sequence["onsets"],
+            widths=sequence["widths"],
+            amplitudes=sequence["amplitudes"],
+            cycle_frequency=cycle_frequency,
+        )
+        all_errors.append(errors)
+        pulse_times = pulse_times.astype("uint32")
+        pulse_voltages = volts_to_dac_codes(
+            volts=pulse_voltages,
+            dac_bitMax=DAC_BITMAX_MODELS[model],
+            dtype=voltage_dtype,
+        )
+
+        key = (pulse_times.tobytes(), pulse_voltages.tobytes())
+        if key not in slots:
+            if len(slots) == len(CUSTOM_PULSE_TRAIN_OPCODES):
+                raise ValueError(
+                    "More than two distinct sequences: "
+                    "the device has only two custom train slots"
+                )
+            if pulse_times.size > max_pulses:
+                raise ValueError(
+                    f"Channel {channel} needs {pulse_times.size} train entries, "
+                    f"model {model} allows {max_pulses} per custom train"
+                )
+            slot = slots[key] = len(slots)
+            custom_trains[slot] = (pulse_times, pulse_voltages)
+            slot_report[slot] = {
+                "n_pulses": int(pulse_times.size),
+                "max_pulses": max_pulses,
+                "utilization": pulse_times.size / max_pulses,
+                "step_cycles": step_cycles,
+                "channels": [],
+            }
+        slot = slots[key]
+        slot_report[slot]["channels"].append(channel)
+
+        channel_params[channel] = {
+            "customTrainID": slot + 1,
+            "customTrainTarget": 0,
+            "customTrainLoop": int(loop_duration is not None),
+            "isBiphasic": False,
+            "phase1Duration": step_cycles / cycle_frequency,
+            "pulseTrainDelay": 0,
+            "pulseTrainDuration": (
+                loop_duration
+                if loop_duration is not None
+                else end_cycles / cycle_frequency
+            ),
+        }
+
+    errors = np.abs(np.concatenate(all_errors))
+    report = {
+        "slots": slot_report,
+        "cycle_period": 1 / cycle_frequency,
+        "max_quantization_error": float(errors.max()) if errors.size else 0.0,
+        "n_quantized": int(np.count_nonzero(errors > 1e-12)),
+    }
+    return CompiledSequence(
+        custom_trains=custom_trains, channel_params=channel_params, report=report
+    )
@@ -0,0 +1,267 @@
+import time
+
+import numpy as np
+
+from pypulsepal.definitions import (
+    PARAM_CODES,
+    PARAM_DTYPE_MODEL_1,
+    PARAM_DTYPE_MODEL_2,
+    ReceiveMessageHeader,
+    SendMessageHeader,
+)
+
+CONFIRMATION = b"\x01"
+
+
+class SimulatedSerial:
+    """In-memory stand-in for the serial object of a PulsePal.
+
+    Parses the byte stream written by the host like the firmware does and queues
+    the replies a device would send (handshake, confirmations, logic levels).
+    Messages may be split across or combined within writes; DISPLAY and SETTINGS
+    messages consume the remainder of the write they arrive in.
+    """
+
+    def __init__(
+        self,
+        firmware_version=22,
+        nr_output_channels=4,
+        nr_trigger_channels=2,
+        opcode=213,
+        latency=0.0,
+        baudrate=None,
+    ):
+        """
+
+        :param firmware_version: firmware version reported on handshake
+        :param nr_output_channels:
+        :param nr_trigger_channels:
+        :param opcode: device opcode prefixing every host message
+        :param latency: seconds added per write that expects a reply
+        :param baudrate: if set, add transfer time of written bytes (8N1)
+        """
+        self._settings = {
+            "firmware_version": firmware_version,
+            "nr_output_channels": nr_output_channels,
+            "nr_trigger_channels": nr_trigger_channels,
+            "opcode": opcode,
+            "latency": latency,
+            "baudrate": baudrate,
+        }
+        self.firmware_version = firmware_version
+        self.model = 1 if firmware_version < 20 else 2
+        self.param_dtype_lookup = (
+            PARAM_DTYPE_MODEL_1 if self.model == 1 else PARAM_DTYPE_MODEL_2
+        )
+        self.nr_output_channels = nr_output_channels
+        self.nr_trigger_channels = nr_trigger_channels
+        self.opcode = opcode
+        self.latency = latency
+        self.baudrate = baudrate
+
+        self.is_open = True
+        self.is_unplugged = False
+        self.n_writes_after_close = 0
+        self.n_bytes_written = 0
+        self.message_counts = {}
+        self.params = {}
+        self.program_all_payload = None
+        self.custom_trains = {}
+        self.logic_levels = [0] * nr_output_channels
+        self.fixed_voltages = {}
+
+        self._pending = bytearray()
+        self._replies = bytearray()
+
+    @property
+    def voltage_nbytes(self):
+        return np.dtype(self.param_dtype_lookup["phase1Voltage"]).itemsize
+
+    @property
+    def program_all_nbytes(self):
+        n_out, n_trig = self.nr_output_channels, self.nr_trigger_channels
+        if self.model == 1:
+            return n_out * 8 * 4 + n_out * 7 + n_out * 2 + n_trig
+        return n_out * 8 * 4 + n_out * 3 * 2 + n_out * 4 + n_out * 2 + n_trig
+
+    def unplug(self):
+        """Simulate a USB disconnect: further reads and writes raise OSError"""
+        self.is_unplugged = True
+
+    def replug(self):
+        """Fresh device with the same settings, as after power cycling"""
+        return SimulatedSerial(**self._settings)
+
+    def inWaiting(self):
+        if self.is_unplugged:
+            raise OSError("Simulated PulsePal is unplugged")
+        return len(self._replies)
+
+    def read(self, size=1):
+        if self.is_unplugged:
+            raise OSError("Simulated PulsePal is unplugged")
+        reply = bytes(self._replies[:size])
+        del self._replies[:size]
+        return reply
+
+    def write(self, data):
+        data = bytes(data)
+        if self.is_unplugged:
+            raise OSError("Simulated PulsePal is unplugged")
+        if not self.is_open:
+            self.n_writes_after_close += 1
+            return 0
+
+        self.n_bytes_written += len(data)
+        if self.baudrate:
+            time.sleep(len(data) * 10 / self.baudrate)
+
+        n_replies_before = len(self._replies)
+        self._pending += data
+        while self._pending:
+            consumed = self._parse_message(self._pending)
+            if consumed is None:
+                break
+            del self._pending[:consumed]
+        if self.latency and len(self._replies) > n_replies_before:
+            time.sleep(self.latency)
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+    def _parse_message(self, buffer):
+        """Handle one complete message at the start of `buffer`.
+
+        :return: number of bytes consumed, None if the message is incomplete
+        """
+        if buffer[0] != self.opcode:
+            # Not a message start: drop the byte like the firmware would
+            return 1
+        if len(buffer) < 2:
+            return None
+
+        header = buffer[1]
+        body = bytes(buffer[2:])
+        self.message_counts[header] = self.message_counts.get(header, 0) + 1
+
+        if header == ord(SendMessageHeader.HANDSHAKE):
+            self._replies += str.encode(ReceiveMessageHeader.HANDSHAKE_OK)
+            self._replies += np.array(self.firmware_version, "uint32").tobytes()
+            return 2
+
+        if header == SendMessageHeader.CLIENT_ID:
+            return 2 + 6 if len(body) >= 6 else None
+
+        if header in (SendMessageHeader.DISPLAY, SendMessageHeader.SETTINGS):
+            return len(buffer)
+
+        if header == SendMessageHeader.PROGRAM_ALL:
+            if len(body) < self.program_all_nbytes:
+                return None
+            self.program_all_payload = body[: self.program_all_nbytes]
+            self._replies += CONFIRMATION
+            return 2 + self.program_all_nbytes
+
+        if header == SendMessageHeader.PROGRAM_ONE:
+            if len(body) < 2:
+                return None
+            param_code, channel = body[0], body[1]
+            param_dtype = np.dtype(self.param_dtype_lookup[PARAM_CODES[param_code]])
+            if len(body) < 2 + param_dtype.itemsize:
+                return None
+            value = np.frombuffer(body[2 : 2 + param_dtype.itemsize], param_dtype)
+            self.params[(PARAM_CODES[param_code], channel - 1)] = value.item()
+            self._replies += CONFIRMATION
+            return 2 + 2 + param_dtype.itemsize
+
+        if header in (
+            SendMessageHeader.PROGRAM_CUSTOM_1,
+            SendMessageHeader.PROGRAM_CUSTOM_2,
+        ):
+            offset = 1 if self.model == 1 else 0
+            if len(body) < offset + 4:
+                return None
+            n_pulses = int(np.frombuffer(body[offset : offset + 4], "uint32")[0])
+            nbytes = offset + 4 + n_pulses * (4 + self.voltage_nbytes)
+            if len(body) < nbytes:
+                return None
+            times_start = offset + 4
+            voltages_start = times_start + 4 * n_pulses
+            self.custom_trains[header - SendMessageHeader.PROGRAM_CUSTOM_1] = (
+                np.frombuffer(body[times_start:voltages_start], "uint32").copy(),
+                np.frombuffer(
+                    body[voltages_start:nbytes],
+                    self.param_dtype_lookup["phase1Voltage"],
+                ).copy(),
+            )
+            self._replies += CONFIRMATION
+            return 2 + nbytes
+
+        if header == SendMessageHeader.SOFT_TRIGGER:
+            return 3 if body else None
+
+        if header == SendMessageHeader.PROGRAM_VOLT:
+            if len(body) < 1 + self.voltage_nbytes:
+                return None
+            self.fixed_voltages[body[0] - 1] = np.frombuffer(
+                body[1 : 1 + self.voltage_nbytes],
+                self.param_dtype_lookup["phase1Voltage"],
+            ).item()
+            self._replies += CONFIRMATION
+            return 2 + 1 + self.voltage_nbytes
+
+        if header in (SendMessageHeader.ABORT_ALL, SendMessageHeader.DISCONNECT):
+            self._replies += CONFIRMATION
+            return 2
+
+        if header in (SendMessageHeader.CONTINUOUS, SendMessageHeader.LOGIC_SET):
+            if len(body) < 2:
+                return None
+            if header == SendMessageHeader.LOGIC_SET:
+                self.logic_levels[body[0] - 1] = body[1]
+            self._replies += CONFIRMATION
+            return 4
+
+        if header == SendMessageHeader.LOGIC_GET:
+            if not body:
+                return None
+            self._replies += bytes([self.logic_levels[body[0] - 1]])
+            return 3
+
+        raise ValueError(f"Simulated PulsePal got unknown message header {header}")
+
+
+class SimulatedArCOM:
+    """Drop-in replacement for pybpodapi's ArCOM backed by a SimulatedSerial"""
+
+    def __init__(self, serial_object=None, **kwargs):
+        """
+
+        :param serial_object: SimulatedSerial, created from kwargs if None
+        :param kwargs: passed to SimulatedSerial
+        """
+        self.serial_object = serial_object or SimulatedSerial(**kwargs)
+
+    def open(self, serial_port=None, baudrate=115200, timeout=1):
+        if self.serial_object.is_unplugged or not self.serial_object.is_open:
+            self.serial_object = self.serial_object.replug()
+        return self
+
+    def close(self):
+        self.serial_object.close()
+
+    def bytes_available(self):
+        return self.serial_object.inWaiting()
+
+    def write_array(self, array):
+        self.serial_object.write(array)
+
+    def read_char(self):
+        return self.serial_object.read(1).decode("utf-8")
+
+    def read_uint8(self):
+        return int.from_bytes(self.serial_object.read(1), byteorder="little")
+
+    def read_uint32(self):
+        return int.from_bytes(self.serial_object.read(4), byteorder="little")
@@ -0,0 +1,159 @@
+"""Compact binary snapshots of the PulsePal client state.
+
+Layout (little-endian):
+  - magic b"PPSN" and format version (uint8)
+  - firmware_version (uint32), model, opcode, nr_output_channels,
+    nr_trigger_channels (uint8 each), cycle_frequency (uint32)
+  - channel parameters as float64, one row per CHANNEL_PARAM_DEFAULTS entry
+  - trigger modes (uint8)
+  - number of custom trains (uint8), then per train: slot (uint8), whether the
+    contents are included (uint8), number of pulses (uint32), sha256 digest of
+    the encoded train (32 bytes) and optionally the pulse times (uint32) and
+    voltages (model-specific DAC code dtype)
+"""
+
+import hashlib
+import struct
+
+import numpy as np
+
+from pypulsepal.definitions import CHANNEL_PARAM_DEFAULTS, PARAM_DTYPE_MODELS
+
+SNAPSHOT_MAGIC = b"PPSN"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<4sBIBBBBI")
+_TRAIN_HEADER = struct.Struct("<BBI32s")
+
+
+class SnapshotError(Exception):
+    """Convenience error object for invalid snapshots"""
+
+    pass
+
+
+def custom_train_digest(pulse_times=None, pulse_voltages=None):
+    """sha256 digest identifying an encoded custom train"""
+    digest = hashlib.sha256(np.asarray(pulse_times, dtype="uint32").tobytes())
+    digest.update(np.asarray(pulse_voltages).tobytes())
+    return digest.digest()
+
+
+def pack_snapshot(pulsepal=None, include_custom_trains=True):
+    """Serialize the client state of a connected PulsePal.
+
+    :param pulsepal: PulsePal object
+    :param include_custom_trains: include train contents, otherwise digests only
+    :return: bytes
+    """
+    parts = [
+        _HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            pulsepal.firmware_version,
+            pulsepal.model,
+            pulsepal.opcode,
+            pulsepal.nr_output_channels,
+            pulsepal.nr_trigger_channels,
+            pulsepal.cycle_frequency,
+        ),
+        np.asarray(
+            [getattr(pulsepal, param) for param in CHANNEL_PARAM_DEFAULTS],
+            dtype="<f8",
+        ).tobytes(),
+        np.asarray(pulsepal.triggerMode, dtype="uint8").tobytes(),
+        struct.pack("<B", len(pulsepal.custom_trains)),
+    ]
+    for slot, (pulse_times, pulse_voltages) in sorted(pulsepal.custom_trains.items()):
+        parts.append(
+            _TRAIN_HEADER.pack(
+                slot,
+                include_custom_trains,
+                len(pulse_times),
+                custom_train_digest(pulse_times, pulse_voltages),
+            )
+        )
+        if include_custom_trains:
+            parts.append(np.asarray(pulse_times, dtype="<u4").tobytes())
+            parts.append(np.asarray(pulse_voltages).tobytes())
+    return b"".join(parts)
+
+
+def unpack_snapshot(data=None):
+    """Deserialize a snapshot created by pack_snapshot().
+
+    :param data: bytes
+    :return: dict with hardware attributes, "channel_params", "trigger_params" and
+        "custom_trains" ({slot: {"digest", "n_pulses", "pulse_times",
+        "pulse_voltages"}}, contents are None if not included)
+    """
+    data = memoryview(data)
+    (
+        magic,
+        version,
+        firmware_version,
+        model,
+        opcode,
+        nr_output_channels,
+        nr_trigger_channels,
+        cycle_frequency,
+    ) = _HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Not a version {SNAPSHOT_VERSION} PulsePal snapshot")
+    offset = _HEADER.size
+
+    n_params = len(CHANNEL_PARAM_DEFAULTS)
+    params = np.frombuffer(
+        data, dtype="<f8", count=n_params * nr_output_channels, offset=offset
+    ).reshape(n_params, nr_output_channels)
+    offset += params.nbytes
+    trigger_modes = np.frombuffer(
+        data, dtype="uint8", count=nr_trigger_channels, offset=offset
+    )
+    offset += trigger_modes.nbytes
+
+    (n_trains,) = struct.unpack_from("<B", data, offset)
+    offset += 1
+    voltage_dtype = np.dtype(PARAM_DTYPE_MODELS[model]["phase1Voltage"])
+    custom_trains = {}
+    for _ in range(n_trains):
+        slot, has_contents, n_pulses, digest = _TRAIN_HEADER.unpack_from(data, offset)
+        offset += _TRAIN_HEADER.size
+        pulse_times = pulse_voltages = None
+        if has_contents:
+            pulse_times = np.frombuffer(data, "<u4", count=n_pulses, offset=offset)
+            offset += pulse_times.nbytes
+            pulse_voltages = np.frombuffer(
+                data, voltage_dtype, count=n_pulses, offset=offset
+            )
+            offset += pulse_voltages.nbytes
+            if custom_train_digest(pulse_times, pulse_voltages) != digest:
+                raise SnapshotError(f"Custom train {slot} does not match its digest")
+        custom_trains[slot] = {
+            "digest": digest,
+            "n_pulses": n_pulses,
+            "pulse_times": pulse_times,
+            "pulse_voltages": pulse_voltages,
+        }
+
+    # Restore bools/ints as such so that the parameter lists look as if set by hand
+    channel_params = {}
+    for param, values in zip(CHANNEL_PARAM_DEFAULTS, params):
+        default = CHANNEL_PARAM_DEFAULTS[param]
+        if isinstance(default, bool):
+            channel_params[param] = [bool(v) for v in values]
+        elif isinstance(default, int) and np.all(values == np.round(values)):
+            channel_params[param] = [int(v) for v in values]
+        else:
+            channel_params[param] = [float(v) for v in values]
+
+    return {
+        "firmware_version": firmware_version,
+        "model": model,
+        "opcode": opcode,
+        "nr_output_channels": nr_output_channels,
+        "nr_trigger_channels": nr_trigger_channels,
+        "cycle_frequency": cycle_frequency,
+        "channel_params": channel_params,
+        "trigger_params": {"triggerMode": [int(v) for v in trigger_modes]},
+        "custom_trains": custom_trains,
+    }
@@ -0,0 +1,252 @@
+import gc
+import logging
+import os
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from pypulsepal.pulsepal import PulsePal
+from pypulsepal.simulation import SimulatedArCOM
+
+DEFAULT_OPERATION_MIX = {
+    "sync_all_params": 1,
+    "program_one_param": 4,
+    "upload_custom_pulse_train": 1,
+    "trigger_selected_channels": 4,
+    "reconnect": 0.1,
+}
+PERCENTILES = (50, 95, 99)
+TRACE_FILTERS = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+
+def simulated_pulsepal(**kwargs):
+    """Create a PulsePal connected to a fresh simulated device"""
+    return PulsePal(serial_port="simulated", arcom=SimulatedArCOM(**kwargs))
+
+
+def _op_sync_all_params(pulsepal, rng):
+    return pulsepal.sync_all_params()
+
+
+def _op_program_one_param(pulsepal, rng):
+    param_name = "phase1Duration" if rng.random() < 0.5 else "phase1Voltage"
+    param_value = (
+        float(rng.uniform(0.0001, 0.01))
+        if param_name == "phase1Duration"
+        else float(rng.uniform(-10, 10))
+    )
+    return pulsepal.program_one_param(
+        channel=int(rng.integers(pulsepal.nr_output_channels)),
+        param_name=param_name,
+        param_value=param_value,
+    )
+
+
+def _op_upload_custom_pulse_train(pulsepal, rng):
+    n_pulses = int(rng.integers(10, 1000))
+    pulse_times = np.sort(rng.uniform(0, 10, n_pulses))
+    return pulsepal.upload_custom_pulse_train(
+        pulse_train_id=int(rng.integers(2)),
+        pulse_times=pulse_times,
+        pulse_voltages=rng.uniform(-10, 10, n_pulses),
+    )
+
+
+def _op_trigger_selected_channels(pulsepal, rng):
+    channels = rng.integers(2, size=4).astype(bool)
+    return pulsepal.trigger_selected_channels(*channels)
+
+
+OPERATIONS = {
+    "sync_all_params": _op_sync_all_params,
+    "program_one_param": _op_program_one_param,
+    "upload_custom_pulse_train": _op_upload_custom_pulse_train,
+    "trigger_selected_channels": _op_trigger_selected_channels,
+}
+
+
+def resident_memory():
+    """Current resident set size in bytes, None where it cannot be determined.
+
+    Uses psutil if installed, otherwise /proc on Linux.
+    """
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        return psutil.Process().memory_info().rss
+
+    statm = Path("/proc/self/statm")
+    if statm.exists():
+        return int(statm.read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return None
+
+
+def _latency_percentiles(latencies):
+    latencies = np.asarray(latencies, dtype="float64")
+    stats = {"n": int(latencies.size)}
+    if latencies.size:
+        for percentile in PERCENTILES:
+            stats[f"p{percentile}"] = float(np.percentile(latencies, percentile))
+        stats["max"] = float(latencies.max())
+    return stats
+
+
+def run_soak_test(
+    pulsepal_factory=simulated_pulsepal,
+    duration=60,
+    window=10,
+    operation_mix=None,
+    seed=0,
+    latency_drift_factor=2.0,
+    memory_growth_limit=1024**2,
+    top_allocations=5,
+):
+    """Drive a PulsePal with a mix of operations and watch for drift and leaks.
+
+    Operations are drawn at random according to `operation_mix`. Per `window`
+    seconds, latency percentiles per operation, traced (tracemalloc) and resident
+    memory are recorded. The "reconnect" operation replaces the PulsePal with a
+    fresh one from `pulsepal_factory` and checks that the old connection is not
+    written to after it was closed. If the factory raises, the run is aborted.
+
+    Flags are raised for:
+      - p95 latency of an operation in the last window exceeding
+        `latency_drift_factor` times its p95 in the first window
+      - traced memory growth beyond `memory_growth_limit` bytes between the first
+        and the last window (the largest growing allocation sites are listed)
+      - writes to a closed connection, e.g. from __del__ after __exit__
+
+    :param pulsepal_factory: callable returning a connected PulsePal
+    :param duration: total run time in seconds
+    :param window: length of one reporting window in seconds
+    :param operation_mix: dict of operation name to relative weight
+    :param seed: random seed for the operation sequence
+    :param latency_drift_factor: allowed p95 ratio last/first window
+    :param memory_growth_limit: allowed traced memory growth in bytes
+    :param top_allocations: number of growing allocation sites to report
+    :return: dict with per-window statistics and a list of flags
+    """
+    operation_mix = operation_mix or DEFAULT_OPERATION_MIX
+    names = list(operation_mix)
+    weights = np.asarray([operation_mix[name] for name in names], dtype="float64")
+    weights /= weights.sum()
+    rng = np.random.default_rng(seed)
+
+    pulsepal = pulsepal_factory()
+    windows = []
+    first_snapshot = last_snapshot = None
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    start_time = time.perf_counter()
+    window_end = start_time + window
+    latencies = {name: [] for name in names}
+    n_errors = n_writes_after_close = 0
+    aborted = False
+    try:
+        while True:
+            name = names[rng.choice(len(names), p=weights)]
+            op_start = time.perf_counter()
+            try:
+                if name == "reconnect":
+                    closed_serial = pulsepal._arcom.serial_object
+                    with pulsepal:
+                        pass
+                    try:
+                        new_pulsepal = pulsepal_factory()
+                    except Exception:
+                        # Keep the closed PulsePal: later ops would only fail too
+                        n_errors += 1
+                        aborted = True
+                        logging.exception("Soak reconnect failed, aborting run")
+                        break
+                    # Rebinding drops the old PulsePal and runs its __del__
+                    pulsepal, new_pulsepal = new_pulsepal, None
+                    gc.collect()
+                    n_writes_after_close += getattr(
+                        closed_serial, "n_writes_after_close", 0
+                    )
+                    del closed_serial
+                else:
+                    OPERATIONS[name](pulsepal, rng)
+            except Exception:
+                n_errors += 1
+                logging.exception(f"Soak operation '{name}' failed")
+            now = time.perf_counter()
+            latencies[name].append(now - op_start)
+
+            if now >= window_end:
+                window_latency = {
+                    op: _latency_percentiles(values) for op, values in latencies.items()
+                }
+                gc.collect()
+                last_snapshot = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+                first_snapshot = first_snapshot or last_snapshot
+                windows.append(
+                    {
+                        "time": now - start_time,
+                        "latency": window_latency,
+                        "traced_memory": sum(
+                            stat.size for stat in last_snapshot.statistics("filename")
+                        ),
+                        "resident_memory": resident_memory(),
+                    }
+                )
+                logging.info(f"Soak window {len(windows)}: {windows[-1]}")
+                latencies = {name: [] for name in names}
+                window_end += window
+                if now - start_time >= duration:
+                    break
+    finally:
+        pulsepal.disconnect()
+        if started_tracing:
+            tracemalloc.stop()
+
+    flags = []
+    if len(windows) > 1:
+        first, last = windows[0], windows[-1]
+        for op in names:
+            first_p95 = first["latency"][op].get("p95")
+            last_p95 = last["latency"][op].get("p95")
+            if first_p95 and last_p95 and last_p95 > latency_drift_factor * first_p95:
+                flags.append(
+                    f"Latency drift in '{op}': p95 {first_p95 * 1e3:.3f} ms -> "
+                    f"{last_p95 * 1e3:.3f} ms"
+                )
+
+        memory_growth = last["traced_memory"] - first["traced_memory"]
+        if memory_growth > memory_growth_limit:
+            top_stats = last_snapshot.compare_to(first_snapshot, "lineno")
+            sites = "; ".join(str(stat) for stat in top_stats[:top_allocations])
+            flags.append(
+                f"Traced memory grew by {memory_growth} bytes. Top sites: {sites}"
+            )
+
+    if n_writes_after_close:
+        flags.append(f"{n_writes_after_close} writes to closed connections")
+    if n_errors:
+        flags.append(f"{n_errors} operations raised errors")
+    if aborted:
+        flags.append("Run aborted after a failed reconnect")
+
+    for flag in flags:
+        logging.warning(f"Soak test: {flag}")
+
+    return {
+        "duration": time.perf_counter() - start_time,
+        "windows": windows,
+        "n_errors": n_errors,
+        "n_writes_after_close": n_writes_after_close,
+        "aborted": aborted,
+        "flags": flags,
+    }
@@ -0,0 +1,337 @@
+"""Serial transfer cost model and upload planner.
+
+The cost of a command is modelled as `n_bytes * byte_time + n_round_trips *
+round_trip_latency`. The initial byte time follows from the baudrate (10 bits per
+byte for 8N1); both terms are refitted from measured command timings, which also
+covers native USB devices where the nominal baudrate does not limit throughput.
+"""
+
+import collections
+import functools
+import logging
+import time
+
+import numpy as np
+
+from pypulsepal.definitions import (
+    CHANNEL_PARAM_DEFAULTS,
+    PARAM_DTYPE_MODELS,
+    TRIGGER_PARAM_DEFAULTS,
+)
+from pypulsepal.payloads import encode_program_all_payload
+
+BITS_PER_BYTE = 10
+
+
+class Command:
+    """One serial command: its size, number of confirmations and how to run it"""
+
+    def __init__(self, name=None, n_bytes=None, n_round_trips=1, run=None):
+        """
+
+        :param name: label for reports
+        :param n_bytes: bytes written to the device
+        :param n_round_trips: replies waited for
+        :param run: callable that sends the command
+        """
+        self.name = name
+        self.n_bytes = n_bytes
+        self.n_round_trips = n_round_trips
+        self.run = run
+
+    def __repr__(self):
+        return (
+            f"Command({self.name!r}, n_bytes={self.n_bytes}, "
+            f"n_round_trips={self.n_round_trips})"
+        )
+
+
+def program_one_param_command(
+    pulsepal=None, channel=None, param_name=None, param_value=None
+):
+    param_dtype = np.dtype(PARAM_DTYPE_MODELS[pulsepal.model][param_name])
+    return Command(
+        name=f"program_one_param({param_name}, ch{channel})",
+        n_bytes=4 + param_dtype.itemsize,
+        run=functools.partial(
+            pulsepal.program_one_param,
+            channel=channel,
+            param_name=param_name,
+            param_value=param_value,
+        ),
+    )
+
+
+def upload_all_commands(pulsepal=None):
+    """upload_all() as one command per parameter, so it can be split up"""
+    commands = []
+    for param_name in CHANNEL_PARAM_DEFAULTS:
+        for channel in range(pulsepal.nr_output_channels):
+            commands.append(
+                program_one_param_command(
+                    pulsepal=pulsepal,
+                    channel=channel,
+                    param_name=param_name,
+                    param_value=getattr(pulsepal, param_name)[channel],
+                )
+            )
+    for trigger_channel in range(pulsepal.nr_trigger_channels):
+        commands.append(
+            program_one_param_command(
+                pulsepal=pulsepal,
+                channel=trigger_channel,
+                param_name="triggerMode",
+                param_value=pulsepal.triggerMode[trigger_channel],
+            )
+        )
+    return commands
+
+
+def sync_all_params_command(pulsepal=None):
+    params = {
+        param: getattr(pulsepal, param)
+        for param in [*CHANNEL_PARAM_DEFAULTS, *TRIGGER_PARAM_DEFAULTS]
+    }
+    payload = encode_program_all_payload(
+        params=params,
+        model=pulsepal.model,
+        cycle_frequency=pulsepal.cycle_frequency,
+        nr_output_channels=pulsepal.nr_output_channels,
+        nr_trigger_channels=pulsepal.nr_trigger_channels,
+    )
+    return Command(
+        name="sync_all_params",
+        n_bytes=1 + len(payload),
+        run=pulsepal.sync_all_params,
+    )
+
+
+def custom_train_nbytes(model=None, n_pulses=None):
+    voltage_nbytes = np.dtype(PARAM_DTYPE_MODELS[model]["phase1Voltage"]).itemsize
+    header_nbytes = 2 + (1 if model == 1 else 0) + 4
+    return header_nbytes + n_pulses * (4 + voltage_nbytes)
+
+
+def upload_custom_pulse_train_command(
+    pulsepal=None, pulse_train_id=None, pulse_times=None, pulse_voltages=None
+):
+    return Command(
+        name=f"upload_custom_pulse_train({pulse_train_id})",
+        n_bytes=custom_train_nbytes(model=pulsepal.model, n_pulses=len(pulse_times)),
+        run=functools.partial(
+            pulsepal.upload_custom_pulse_train,
+            pulse_train_id=pulse_train_id,
+            pulse_times=pulse_times,
+            pulse_voltages=pulse_voltages,
+        ),
+    )
+
+
+def upload_custom_waveform_command(
+    pulsepal=None, pulse_train_id=None, pulse_width=None, pulse_voltages=None
+):
+    return Command(
+        name=f"upload_custom_waveform({pulse_train_id})",
+        n_bytes=custom_train_nbytes(model=pulsepal.model, n_pulses=len(pulse_voltages)),
+        run=functools.partial(
+            pulsepal.upload_custom_waveform,
+            pulse_train_id=pulse_train_id,
+            pulse_width=pulse_width,
+            pulse_voltages=pulse_voltages,
+        ),
+    )
+
+
+class TransferCostModel:
+    """Estimate command durations from byte counts and round trips"""
+
+    def __init__(self, baudrate=115200, round_trip_latency=0.001, history=200):
+        """
+
+        :param baudrate: initial byte time is BITS_PER_BYTE / baudrate
+        :param round_trip_latency: initial seconds per reply waited for
+        :param history: number of recent timings used to refit the model
+        """
+        self.byte_time = BITS_PER_BYTE / baudrate
+        self.round_trip_latency = round_trip_latency
+        self._observations = collections.deque(maxlen=history)
+
+    @classmethod
+    def from_pulsepal(cls, pulsepal=None, **kwargs):
+        return cls(baudrate=pulsepal.baudrate, **kwargs)
+
+    def estimate(self, n_bytes=None, n_round_trips=1):
+        """Estimated duration in seconds"""
+        return n_bytes * self.byte_time + n_round_trips * self.round_trip_latency
+
+    def estimate_command(self, command=None):
+        return self.estimate(
+            n_bytes=command.n_bytes, n_round_trips=command.n_round_trips
+        )
+
+    def estimate_commands(self, commands=None):
+        return sum(self.estimate_command(command) for command in commands)
+
+    def observe(self, n_bytes=None, n_round_trips=1, elapsed=None):
+        """Add a measured timing and refit the model"""
+        self._observations.append((n_bytes, n_round_trips, elapsed))
+        observations = np.asarray(self._observations, dtype="float64")
+        n_bytes, n_round_trips, elapsed = observations.T
+
+        design = observations[:, :2]
+        if np.linalg.matrix_rank(design) == 2:
+            (byte_time, round_trip_latency), *_ = np.linalg.lstsq(
+                design, elapsed, rcond=None
+            )
+            if byte_time > 0 and round_trip_latency > 0:
+                self.byte_time = float(byte_time)
+                self.round_trip_latency = float(round_trip_latency)
+                return
+        # Too little variation in size for a joint fit: attribute the rest to latency
+        residual = elapsed - n_bytes * self.byte_time
+        self.round_trip_latency = max(
+            float(np.mean(residual / np.maximum(n_round_trips, 1))), 0.0
+        )
+
+    def run(self, command=None):
+        """Run a command, time it and feed the timing back into the model"""
+        start_time = time.perf_counter()
+        result = command.run()
+        self.observe(
+            n_bytes=command.n_bytes,
+            n_round_trips=command.n_round_trips,
+            elapsed=time.perf_counter() - start_time,
+        )
+        return result
+
+    def calibrate(self, pulsepal=None, n_repeats=10):
+        """Time harmless writes of small and large size on a connected PulsePal.
+
+        Re-sends the current phase1Duration of channel 0 and the current parameter
+        set via sync_all_params().
+        """
+        commands = [
+            program_one_param_command(
+                pulsepal=pulsepal,
+                channel=0,
+                param_name="phase1Duration",
+                param_value=pulsepal.phase1Duration[0],
+            ),
+            sync_all_params_command(pulsepal=pulsepal),
+        ]
+        for _ in range(n_repeats):
+            for command in commands:
+                self.run(command=command)
+        return self
+
+
+class UploadPlan:
+    """Commands grouped into chunks that each fit the time budget"""
+
+    def __init__(
+        self, chunks=None, chunk_estimates=None, oversized_chunks=None, deferred=0
+    ):
+        """
+
+        :param chunks: list of lists of Command, in order
+        :param chunk_estimates: estimated duration per chunk in seconds
+        :param oversized_chunks: indices of chunks holding a single command that
+            alone exceeds the budget
+        :param deferred: number of trailing chunks that do not fit before the trigger
+        """
+        self.chunks = chunks
+        self.chunk_estimates = chunk_estimates
+        self.oversized_chunks = oversized_chunks
+        self.deferred = deferred
+
+    @property
+    def oversized(self):
+        """Commands that alone exceed the budget"""
+        return [self.chunks[index][0] for index in self.oversized_chunks]
+
+    @property
+    def fits(self):
+        """True if all commands fit the budget and before the next trigger"""
+        return not self.oversized and not self.deferred
+
+    @property
+    def estimate(self):
+        return sum(self.chunk_estimates)
+
+    def report(self):
+        return {
+            "n_chunks": len(self.chunks),
+            "estimate": self.estimate,
+            "chunk_estimates": list(self.chunk_estimates),
+            "oversized": [command.name for command in self.oversized],
+            "oversized_chunks": list(self.oversized_chunks),
+            "deferred": self.deferred,
+            "fits": self.fits,
+        }
+
+
+class UploadPlanner:
+    """Split pending commands into chunks that fit inter-trial time windows"""
+
+    def __init__(self, cost_model=None):
+        self.cost_model = cost_model
+
+    def plan(self, commands=None, budget=None, time_until_trigger=None):
+        """Group commands, in order, into chunks with estimated duration <= budget.
+
+        A command that alone exceeds the budget gets a chunk of its own, which is
+        flagged in `oversized_chunks`, so that command order is always kept.
+
+        :param commands: list of Command, e.g. upload_all_commands(pulsepal)
+        :param budget: time per chunk in seconds (e.g. one inter-trial window)
+        :param time_until_trigger: seconds until the next scheduled trigger; chunks
+            ending after it are counted as deferred
+        :return: UploadPlan
+        """
+        chunks, chunk_estimates, oversized_chunks = [], [], []
+        chunk, chunk_estimate = [], 0.0
+        for command in commands:
+            estimate = self.cost_model.estimate_command(command=command)
+            if estimate > budget:
+                logging.warning(
+                    f"{command} needs ~{estimate * 1e3:.1f} ms, "
+                    f"more than the {budget * 1e3:.1f} ms budget"
+                )
+            if chunk and (estimate > budget or chunk_estimate + estimate > budget):
+                chunks.append(chunk)
+                chunk_estimates.append(chunk_estimate)
+                chunk, chunk_estimate = [], 0.0
+            chunk.append(command)
+            chunk_estimate += estimate
+            if estimate > budget:
+                oversized_chunks.append(len(chunks))
+                chunks.append(chunk)
+                chunk_estimates.append(chunk_estimate)
+                chunk, chunk_estimate = [], 0.0
+        if chunk:
+            chunks.append(chunk)
+            chunk_estimates.append(chunk_estimate)
+
+        deferred = 0
+        if time_until_trigger is not None:
+            chunk_ends = np.cumsum(chunk_estimates)
+            deferred = int(np.count_nonzero(chunk_ends > time_until_trigger))
+            if deferred:
+                logging.warning(
+                    f"{deferred} of {len(chunks)} chunks do not fit before the next "
+                    f"trigger in {time_until_trigger * 1e3:.1f} ms"
+                )
+
+        return UploadPlan(
+            chunks=chunks,
+            chunk_estimates=chunk_estimates,
+            oversized_chunks=oversized_chunks,
+            deferred=deferred,
+        )
+
+    def execute(self, chunk=None):
+        """Run the commands of one chunk, recalibrating the cost model on the way.
+
+        :return: list of command results
+        """
+        return [self.cost_model.run(command=command) for command in chunk]
@@ -11,3 +11,11 @@ def encode_message(*message_parts, encoding=None):
     message = [np.array(part, dtype=encoding).tobytes() for part in message_parts]
     out = b"".join(message)
     return out
+
+
+def volts_to_dac_codes(volts=None, dac_bitMax=None, dtype=None):
+    """Convert an array of volts to DAC codes in bulk, clipped to the DAC range"""
+    codes = volts_to_bytes(
+        volt=np.asarray(volts, dtype="float64"), dac_bitMax=dac_bitMax
+    )
+    return np.clip(codes, 0, dac_bitMax).astype(dtype)
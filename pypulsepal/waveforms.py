@@ -0,0 +1,193 @@
+"""Waveform generators returning device-ready custom train buffers.
+
+Every generator returns a tuple `(pulse_times, pulse_voltages)` with onset times
+in device cycles (uint32, at `cycle_frequency`) and DAC codes in the voltage dtype
+of the given PulsePal `model` (uint8 for model 1, uint16 for model 2). Both can be
+passed directly to PulsePal.upload_encoded_custom_train().
+
+The sample rate must divide `cycle_frequency`, so that samples are evenly spaced
+in whole device cycles; for continuous waveforms, set the channel's phase1Duration
+to 1 / sample_rate. A waveform must fit the model's custom train length
+(CUSTOM_TRAIN_MAX_PULSES_MODELS).
+
+Results are cached by their parameters (bounded LRU cache), so the returned arrays
+are read-only and shared between calls.
+"""
+
+import functools
+
+import numpy as np
+
+from pypulsepal.definitions import (
+    CUSTOM_TRAIN_MAX_PULSES_MODELS,
+    DAC_BITMAX_MODELS,
+    PARAM_DTYPE_MODELS,
+    PULSEPAL_CYCLE_FREQUENCY,
+)
+from pypulsepal.utils import volts_to_dac_codes
+
+WAVEFORM_CACHE_SIZE = 256
+
+
+def _sample_times(duration=None, sample_rate=None, cycle_frequency=None):
+    """Sample times in seconds, on an even grid of whole device cycles"""
+    step_cycles = cycle_frequency / sample_rate
+    if step_cycles < 1 or not np.isclose(step_cycles, round(step_cycles)):
+        raise ValueError(
+            f"Sample rate {sample_rate} must divide cycle frequency {cycle_frequency}"
+        )
+    n_samples = int(round(duration * sample_rate))
+    return np.arange(n_samples) * round(step_cycles) / cycle_frequency
+
+
+def _encode(times=None, voltages=None, model=None, cycle_frequency=None):
+    """Quantize times to device cycles and voltages to read-only DAC codes"""
+    max_pulses = CUSTOM_TRAIN_MAX_PULSES_MODELS[model]
+    if len(times) > max_pulses:
+        raise ValueError(
+            f"Waveform has {len(times)} entries, "
+            f"model {model} allows {max_pulses} per custom train"
+        )
+    pulse_times = np.round(times * cycle_frequency).astype("uint32")
+    pulse_voltages = volts_to_dac_codes(
+        volts=voltages,
+        dac_bitMax=DAC_BITMAX_MODELS[model],
+        dtype=PARAM_DTYPE_MODELS[model]["phase1Voltage"],
+    )
+    pulse_times.flags.writeable = False
+    pulse_voltages.flags.writeable = False
+    return pulse_times, pulse_voltages
+
+
+@functools.lru_cache(maxsize=WAVEFORM_CACHE_SIZE)
+def sine(
+    frequency=None,
+    amplitude=1.0,
+    offset=0.0,
+    phase=0.0,
+    duration=1.0,
+    sample_rate=1000,
+    model=2,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+):
+    """Sine wave of `frequency` Hz, `amplitude` and `offset` in volts, `phase` in rad"""
+    times = _sample_times(duration, sample_rate, cycle_frequency)
+    voltages = offset + amplitude * np.sin(2 * np.pi * frequency * times + phase)
+    return _encode(times, voltages, model, cycle_frequency)
+
+
+@functools.lru_cache(maxsize=WAVEFORM_CACHE_SIZE)
+def ramp(
+    start_voltage=0.0,
+    stop_voltage=None,
+    duration=1.0,
+    sample_rate=1000,
+    model=2,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+):
+    """Linear ramp from `start_voltage` to `stop_voltage` over `duration` seconds"""
+    times = _sample_times(duration, sample_rate, cycle_frequency)
+    voltages = np.linspace(start_voltage, stop_voltage, times.size)
+    return _encode(times, voltages, model, cycle_frequency)
+
+
+@functools.lru_cache(maxsize=WAVEFORM_CACHE_SIZE)
+def square(
+    frequency=None,
+    amplitude=1.0,
+    offset=0.0,
+    duty_cycle=0.5,
+    duration=1.0,
+    sample_rate=1000,
+    model=2,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+):
+    """Square wave between offset +/- amplitude, high for `duty_cycle` of a period"""
+    times = _sample_times(duration, sample_rate, cycle_frequency)
+    high = np.mod(times * frequency, 1.0) < duty_cycle
+    voltages = offset + np.where(high, amplitude, -amplitude)
+    return _encode(times, voltages, model, cycle_frequency)
+
+
+@functools.lru_cache(maxsize=WAVEFORM_CACHE_SIZE)
+def chirp(
+    start_frequency=None,
+    stop_frequency=None,
+    amplitude=1.0,
+    offset=0.0,
+    duration=1.0,
+    sample_rate=1000,
+    model=2,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+):
+    """Linear frequency sweep from `start_frequency` to `stop_frequency` Hz"""
+    times = _sample_times(duration, sample_rate, cycle_frequency)
+    sweep_rate = (stop_frequency - start_frequency) / duration
+    phase = 2 * np.pi * (start_frequency * times + 0.5 * sweep_rate * times**2)
+    voltages = offset + amplitude * np.sin(phase)
+    return _encode(times, voltages, model, cycle_frequency)
+
+
+@functools.lru_cache(maxsize=WAVEFORM_CACHE_SIZE)
+def noise(
+    amplitude=1.0,
+    offset=0.0,
+    seed=0,
+    duration=1.0,
+    sample_rate=1000,
+    model=2,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+):
+    """Gaussian white noise with standard deviation `amplitude`, seeded by `seed`.
+
+    The seed is required: results are cached, so pass a new seed for new noise.
+    """
+    if seed is None:
+        # Cached results would make "fresh" unseeded noise repeat on every call
+        raise ValueError("noise() needs an explicit seed, vary it for new noise")
+    times = _sample_times(duration, sample_rate, cycle_frequency)
+    rng = np.random.default_rng(seed)
+    voltages = offset + amplitude * rng.standard_normal(times.size)
+    return _encode(times, voltages, model, cycle_frequency)
+
+
+@functools.lru_cache(maxsize=WAVEFORM_CACHE_SIZE)
+def pulse_burst(
+    voltage=None,
+    n_pulses=None,
+    interval=None,
+    n_bursts=1,
+    burst_interval=0.0,
+    model=2,
+    cycle_frequency=PULSEPAL_CYCLE_FREQUENCY,
+):
+    """Bursts of `n_pulses` pulses every `interval` seconds, bursts `burst_interval`
+    apart (onset to onset). The pulse width is the channel's phase1Duration.
+    """
+    pulse_onsets = np.arange(n_pulses) * interval
+    burst_onsets = np.arange(n_bursts) * burst_interval
+    times = (burst_onsets[:, None] + pulse_onsets[None, :]).ravel()
+    if np.any(np.diff(times) <= 0):
+        raise ValueError("Bursts overlap: burst_interval is shorter than a burst")
+    voltages = np.full(times.size, voltage, dtype="float64")
+    return _encode(times, voltages, model, cycle_frequency)
+
+
+WAVEFORM_GENERATORS = {
+    "sine": sine,
+    "ramp": ramp,
+    "square": square,
+    "chirp": chirp,
+    "noise": noise,
+    "pulse_burst": pulse_burst,
+}
+
+
+def cache_info():
+    """Cache statistics per generator"""
+    return {name: func.cache_info() for name, func in WAVEFORM_GENERATORS.items()}
+
+
+def cache_clear():
+    for func in WAVEFORM_GENERATORS.values():
+        func.cache_clear()